@@ -7,3 +7,4 @@ if constants.libint_imported:
 from . import methods
 from . import core
 from . import utils
+from . import deriv_files
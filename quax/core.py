@@ -41,6 +41,7 @@ def check_options(options):
         "damp_factor": 0.5,
         "spectral_shift": True,
         "integral_algo": "libint_core",
+        "debug": False,
     }
 
     for key in options.keys():
@@ -0,0 +1,142 @@
+import numpy as np
+import h5py
+import os
+import atexit
+import collections
+
+from .utils import get_deriv_vec_idx_table, how_many_derivs
+
+# Open HDF5 integral derivative files are kept here, keyed on (path, dataset_name),
+# so that repeated primitive evaluations do not reopen the file for every slice
+_H5_CACHE = {}
+_H5_FILES = {}
+
+# Upper bound on the HDF5 chunk cache, so disk mode never holds a whole derivative tensor in memory.
+_RDCC_MAX_NBYTES = 256 * 1024 ** 2
+
+
+def _next_prime(n):
+    """Smallest prime >= n, used for the number of HDF5 chunk cache hash slots"""
+    n = max(n, 2)
+    while any(n % i == 0 for i in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def _get_dataset(file_name, dataset_name, rdcc_nbytes=None, rdcc_nslots=None):
+    """
+    Return a cached h5py Dataset handle for `dataset_name` in `file_name`,
+    opening the file on first use. `rdcc_nbytes` and `rdcc_nslots` set the size
+    and number of hash slots of the HDF5 chunk cache when the file is opened.
+    """
+    path = os.path.abspath(file_name)
+    key = (path, dataset_name)
+    if key not in _H5_CACHE:
+        if path not in _H5_FILES:
+            _H5_FILES[path] = h5py.File(
+                path, "r", rdcc_nbytes=rdcc_nbytes, rdcc_nslots=rdcc_nslots
+            )
+        _H5_CACHE[key] = _H5_FILES[path][dataset_name]
+    return _H5_CACHE[key]
+
+
+def close_h5_cache():
+    """
+    Close all cached HDF5 file handles. Must be called before the
+    integral derivative files are rewritten.
+    """
+    _H5_CACHE.clear()
+    for f in _H5_FILES.values():
+        f.close()
+    _H5_FILES.clear()
+
+
+atexit.register(close_h5_cache)
+
+
+class OEIDerivReader(object):
+    """
+    Reads overlap, kinetic and potential derivative slices from oei_derivs.h5
+    (or oei_partials.h5) in the working directory.
+    """
+
+    def __init__(self, nbf, natoms, max_deriv_order):
+        self.nbf = nbf
+        # oei_derivs.h5 datasets are chunked as (3, nbf, nbf, 1). Size the chunk cache to hold
+        # one slice per cartesian coordinate (one jacfwd batch), up to a bounded size,
+        # with a prime number of hash slots comparable to the number of chunks
+        nchunks = how_many_derivs(natoms, max(max_deriv_order, 1))
+        self.rdcc_nbytes = min(3 * nbf * nbf * 8 * 3 * natoms, _RDCC_MAX_NBYTES)
+        self.rdcc_nslots = _next_prime(nchunks)
+        # Derivative slices read from disk, keyed on (deriv_order, idx) and shared by overlap,
+        # kinetic and potential. Least recently used slices are evicted past a bounded size
+        self.deriv_slices = collections.OrderedDict()
+        self.max_deriv_slices = max(1, _RDCC_MAX_NBYTES // (3 * nbf * nbf * 8))
+
+    def read_deriv_slices(self, deriv_order, idxs):
+        """
+        Read the overlap, kinetic and potential derivative slices at flattened
+        derivative indices `idxs` from disk, returning a (3, nbf, nbf, len(idxs)) array.
+        The full derivative file packs all three integral types into one dataset per order,
+        so a single HDF5 selection serves all of them. Slices already read are kept,
+        since JAX requests the three integral types, and under nested jacfwd the same
+        derivatives, many times over. Only slices not yet cached are read from disk.
+        """
+        deriv_order = int(deriv_order)
+        idxs = [int(idx) for idx in idxs]
+        missing = sorted({idx for idx in idxs if (deriv_order, idx) not in self.deriv_slices})
+        if missing:
+            block = self.read_deriv_file(deriv_order, missing)
+            for i, idx in enumerate(missing):
+                self.deriv_slices[(deriv_order, idx)] = block[..., i]
+        for idx in idxs:
+            self.deriv_slices.move_to_end((deriv_order, idx))
+        block = np.stack([self.deriv_slices[(deriv_order, idx)] for idx in idxs], axis=-1)
+        while len(self.deriv_slices) > self.max_deriv_slices:
+            self.deriv_slices.popitem(last=False)
+        return block
+
+    def read_deriv_file(self, deriv_order, idxs):
+        """
+        Read the derivative slices at increasing, unique flattened derivative indices `idxs`
+        from whichever integral derivative file is on disk, returning a (3, nbf, nbf, len(idxs)) array.
+        """
+        if os.path.exists("oei_derivs.h5"):
+            # Datasets are expected to be chunked as (3, nbf, nbf, 1),
+            # so that each derivative slice is a single chunk read
+            data_set = _get_dataset(
+                "oei_derivs.h5",
+                "oei_deriv" + str(deriv_order),
+                self.rdcc_nbytes,
+                self.rdcc_nslots,
+            )
+            # h5py fancy indexing requires increasing, unique indices
+            return data_set[:, :, :, idxs]
+        elif os.path.exists("oei_partials.h5"):
+            return np.stack(
+                [
+                    _get_dataset(
+                        "oei_partials.h5", "oei_deriv" + str(deriv_order) + "_" + str(idx)
+                    )[...]
+                    for idx in idxs
+                ],
+                axis=-1,
+            )
+        else:
+            raise Exception("Something went wrong reading integral derivative file")
+
+    def read_deriv_batch(self, integral, deriv_batch):
+        """
+        Read every slice requested by a batch of derivative vectors for one integral type
+        (0: overlap, 1: kinetic, 2: potential) at once, returning a (nbatch, nbf, nbf) array.
+        Returns None if the batch mixes derivative orders or is of order 0.
+        """
+        deriv_batch = np.asarray(deriv_batch, int)
+        orders = np.sum(deriv_batch, axis=1)
+        deriv_order = orders[0]
+        if deriv_order == 0 or not np.all(orders == deriv_order):
+            return None
+        table = get_deriv_vec_idx_table(deriv_batch.shape[1], int(deriv_order))
+        idxs = [table[tuple(v)] for v in deriv_batch]
+        block = self.read_deriv_slices(deriv_order, idxs)[integral]
+        return np.moveaxis(block, 2, 0)
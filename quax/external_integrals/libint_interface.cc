@@ -6,6 +6,7 @@
 #include <libint2.hpp>
 #include <H5Cpp.h>
 #include <iostream>
+#include <algorithm>
 
 #include "buffer_lookups.h"
 
@@ -19,6 +20,9 @@ libint2::BasisSet obs;
 unsigned int nbf;
 unsigned int natom;
 unsigned int ncart;
+// Upper bound on the block of OEI derivative slices held in memory while writing oei_derivs.h5,
+// so disk mode never holds a whole derivative tensor in memory
+const size_t OEI_DERIV_BLOCK_MAX_NBYTES = 256 * 1024 * 1024;
 std::vector<size_t> shell2bf;
 std::vector<long> shell2atom;
 
@@ -735,27 +739,17 @@ py::array eri_deriv(std::vector<int> deriv_vec) {
 // The following function writes all overlap, kinetic, and potential derivatives up to `max_deriv_order` to disk
 // HDF5 File Name: oei_derivs.h5 
 //      HDF5 Dataset names within the file:
-//      overlap_deriv1 
-//          shape (nbf,nbf,n_unique_1st_derivs)
-//      overlap_deriv2 
-//          shape (nbf,nbf,n_unique_2nd_derivs)
-//      overlap_deriv3 
-//          shape (nbf,nbf,n_unique_3rd_derivs)
+//      oei_deriv1 
+//          shape (3,nbf,nbf,n_unique_1st_derivs)
+//      oei_deriv2 
+//          shape (3,nbf,nbf,n_unique_2nd_derivs)
+//      oei_deriv3 
+//          shape (3,nbf,nbf,n_unique_3rd_derivs)
 //      ...
-//      kinetic_deriv1 
-//          shape (nbf,nbf,n_unique_1st_derivs)
-//      kinetic_deriv2 
-//          shape (nbf,nbf,n_unique_2nd_derivs)
-//      kinetic_deriv3 
-//          shape (nbf,nbf,n_unique_3rd_derivs)
-//      ...
-//      potential_deriv1 
-//          shape (nbf,nbf,n_unique_1st_derivs)
-//      potential_deriv2 
-//          shape (nbf,nbf,n_unique_2nd_derivs)
-//      potential_deriv3 
-//          shape (nbf,nbf,n_unique_3rd_derivs)
+// The first axis packs the overlap (0), kinetic (1), and potential (2) integral derivatives,
+// so that one read of a derivative slice serves all three integral types.
 // The number of unique derivatives is essentially equal to the size of the generalized upper triangle of the derivative tensor.
+// Each dataset is chunked as (3,nbf,nbf,1), so that reading a single derivative slice [:,:,:,idx] touches exactly one chunk.
 void oei_deriv_disk(int max_deriv_order) {
     std::cout << "Writing one-electron integral derivative tensors up to order " << max_deriv_order << " to disk...";
     long total_deriv_slices = 0;
@@ -769,6 +763,8 @@ void oei_deriv_disk(int max_deriv_order) {
     double fillvalue = 0.0;
     DSetCreatPropList plist;
     plist.setFillValue(PredType::NATIVE_DOUBLE, &fillvalue);
+    hsize_t chunk_dims[] = {3, nbf, nbf, 1};
+    plist.setChunk(4, chunk_dims);
 
     for (int deriv_order = 1; deriv_order <= max_deriv_order; deriv_order++){
         // how many shell derivatives in the Libint buffer for overlap/kinetic integrals
@@ -797,145 +793,146 @@ void oei_deriv_disk(int max_deriv_order) {
         potential_engine.set_params(libint2::make_point_charges(atoms));
         const auto& potential_buffer = potential_engine.results(); 
 
-        // Define HDF5 dataset names
-        const H5std_string overlap_dset_name("overlap_deriv" + std::to_string(deriv_order));
-        const H5std_string kinetic_dset_name("kinetic_deriv" + std::to_string(deriv_order));
-        const H5std_string potential_dset_name("potential_deriv" + std::to_string(deriv_order));
+        // Define HDF5 dataset name
+        const H5std_string oei_dset_name("oei_deriv" + std::to_string(deriv_order));
 
         // Define rank and dimensions of data that will be written to the file
-        hsize_t file_dims[] = {nbf, nbf, nderivs_triu};
-        DataSpace fspace(3, file_dims);
-        // Create dataset for each integral type and write 0.0's into the file 
-        DataSet* overlap_dataset = new DataSet(file->createDataSet(overlap_dset_name, PredType::NATIVE_DOUBLE, fspace, plist));
-        DataSet* kinetic_dataset = new DataSet(file->createDataSet(kinetic_dset_name, PredType::NATIVE_DOUBLE, fspace, plist));
-        DataSet* potential_dataset = new DataSet(file->createDataSet(potential_dset_name, PredType::NATIVE_DOUBLE, fspace, plist));
-        hsize_t stride[3] = {1,1,1}; // stride and block can be used to 
-        hsize_t block[3] = {1,1,1};  // add values to multiple places, useful if symmetry ever used.
-        hsize_t zerostart[3] = {0,0,0};
-
-        for(auto s1=0; s1!=obs.size(); ++s1) {
-            auto bf1 = shell2bf[s1];  // first basis function in first shell
-            auto atom1 = shell2atom[s1]; // Atom index of shell 1
-            auto n1 = obs[s1].size(); // number of basis functions in first shell
-            for(auto s2=0; s2!=obs.size(); ++s2) {
-                auto bf2 = shell2bf[s2];  // first basis function in second shell
-                auto atom2 = shell2atom[s2]; // Atom index of shell 2
-                auto n2 = obs[s2].size(); // number of basis functions in second shell
-                //if (atom1 == atom2) continue;
-                std::vector<long> shell_atom_index_list{atom1,atom2};
-
-                overlap_engine.compute(obs[s1], obs[s2]);
-                kinetic_engine.compute(obs[s1], obs[s2]);
-                potential_engine.compute(obs[s1], obs[s2]);
-
-                // Define shell set slabs
-                double overlap_shellset_slab [n1][n2][nderivs_triu] = {};
-                double kinetic_shellset_slab [n1][n2][nderivs_triu] = {};
-                double potential_shellset_slab [n1][n2][nderivs_triu] = {};
-                
-                // Loop over every possible unique nuclear cartesian derivative index (flattened upper triangle)
-                // For 1st derivatives of 2 atom system, this is 6. 2nd derivatives of 2 atom system: 21, etc
-                for(int nuc_idx=0; nuc_idx < nderivs_triu; ++nuc_idx) {
-                    // Look up multidimensional cartesian derivative index
-                    auto multi_cart_idx = cart_multidim_lookup[nuc_idx];
-                    // For overlap/kinetic and potential sepearately, create a vector of vectors called `indices`, where each subvector
-                    // is your possible choices for the first derivative operator, second, third, etc and the total number of subvectors is order of differentiation
-                    // What follows fills these indices
-                    std::vector<std::vector<int>> indices(deriv_order, std::vector<int> (0,0));
-                    std::vector<std::vector<int>> potential_indices(deriv_order, std::vector<int> (0,0));
+        hsize_t file_dims[] = {3, nbf, nbf, nderivs_triu};
+        DataSpace fspace(4, file_dims);
+        // Create packed dataset for all integral types and write 0.0's into the file 
+        DataSet* oei_dataset = new DataSet(file->createDataSet(oei_dset_name, PredType::NATIVE_DOUBLE, fspace, plist));
+        hsize_t stride[4] = {1,1,1,1}; // stride and block can be used to 
+        hsize_t block[4] = {1,1,1,1};  // add values to multiple places, useful if symmetry ever used.
+        hsize_t zerostart[4] = {0,0,0,0};
+        // Derivative slices are accumulated in memory in blocks of at most OEI_DERIV_BLOCK_MAX_NBYTES,
+        // and each block is written with a single call, so every (3,nbf,nbf,1) chunk is written exactly once.
+        // Shell pairs are recomputed for every block, which only happens for datasets larger than one block.
+        size_t slice_nbytes = (size_t) 3 * nbf * nbf * sizeof(double);
+        unsigned int block_size = std::max((size_t) 1, OEI_DERIV_BLOCK_MAX_NBYTES / slice_nbytes);
+        for (unsigned int block_start = 0; block_start < nderivs_triu; block_start += block_size) {
+            unsigned int block_end = std::min(block_start + block_size, nderivs_triu);
+            unsigned int nblock = block_end - block_start;
+            // Block of derivative slices with shape (3,nbf,nbf,nblock), first index is the integral type (overlap, kinetic, potential)
+            std::vector<double> oei_block((size_t) 3 * nbf * nbf * nblock, 0.0);
+            auto block_offset = [&](int type, int bf_1, int bf_2, int nuc_idx) {
+                return (((size_t) type * nbf + bf_1) * nbf + bf_2) * nblock + (nuc_idx - block_start);
+            };
+
+            for(auto s1=0; s1!=obs.size(); ++s1) {
+                auto bf1 = shell2bf[s1];  // first basis function in first shell
+                auto atom1 = shell2atom[s1]; // Atom index of shell 1
+                auto n1 = obs[s1].size(); // number of basis functions in first shell
+                for(auto s2=0; s2!=obs.size(); ++s2) {
+                    auto bf2 = shell2bf[s2];  // first basis function in second shell
+                    auto atom2 = shell2atom[s2]; // Atom index of shell 2
+                    auto n2 = obs[s2].size(); // number of basis functions in second shell
+                    //if (atom1 == atom2) continue;
+                    std::vector<long> shell_atom_index_list{atom1,atom2};
+
+                    overlap_engine.compute(obs[s1], obs[s2]);
+                    kinetic_engine.compute(obs[s1], obs[s2]);
+                    potential_engine.compute(obs[s1], obs[s2]);
+
+                    // Loop over every unique nuclear cartesian derivative index (flattened upper triangle) in this block
+                    // For 1st derivatives of 2 atom system, this is 6. 2nd derivatives of 2 atom system: 21, etc
+                    for(int nuc_idx=block_start; nuc_idx < block_end; ++nuc_idx) {
+                        // Look up multidimensional cartesian derivative index
+                        auto multi_cart_idx = cart_multidim_lookup[nuc_idx];
+                        // For overlap/kinetic and potential sepearately, create a vector of vectors called `indices`, where each subvector
+                        // is your possible choices for the first derivative operator, second, third, etc and the total number of subvectors is order of differentiation
+                        // What follows fills these indices
+                        std::vector<std::vector<int>> indices(deriv_order, std::vector<int> (0,0));
+                        std::vector<std::vector<int>> potential_indices(deriv_order, std::vector<int> (0,0));
                 
-                    // Loop over each cartesian coordinate index which we are differentiating wrt for this nuclear cartesian derivative index
-                    // and check to see if it is present in the shell duet, and where it is present in the potential operator 
-                    for (int j=0; j < multi_cart_idx.size(); j++){
-                        int desired_atom_idx = multi_cart_idx[j] / 3;
-                        int desired_coord = multi_cart_idx[j] % 3;
-                        // Loop over shell indices
-                        for (int i=0; i<2; i++){
-                            int atom_idx = shell_atom_index_list[i];
-                            if (atom_idx == desired_atom_idx) {
-                                int tmp = 3 * i + desired_coord;
-                                indices[j].push_back(tmp);
-                                potential_indices[j].push_back(tmp);
+                        // Loop over each cartesian coordinate index which we are differentiating wrt for this nuclear cartesian derivative index
+                        // and check to see if it is present in the shell duet, and where it is present in the potential operator 
+                        for (int j=0; j < multi_cart_idx.size(); j++){
+                            int desired_atom_idx = multi_cart_idx[j] / 3;
+                            int desired_coord = multi_cart_idx[j] % 3;
+                            // Loop over shell indices
+                            for (int i=0; i<2; i++){
+                                int atom_idx = shell_atom_index_list[i];
+                                if (atom_idx == desired_atom_idx) {
+                                    int tmp = 3 * i + desired_coord;
+                                    indices[j].push_back(tmp);
+                                    potential_indices[j].push_back(tmp);
+                                }
                             }
-                        }
-                        // Now for potentials only, loop over each atom in molecule, and if this derivative
-                        // differentiates wrt that atom, we also need to collect that index.
-                        // If libint ever removes that extra NCART dimension, remove the `+ natom`
-                        for (int i=0; i<natom; i++){
-                            if (i == desired_atom_idx) {
-                                int offset_i = i + 2 + natom;
-                                int tmp = 3 * offset_i + desired_coord;
-                                potential_indices[j].push_back(tmp);
+                            // Now for potentials only, loop over each atom in molecule, and if this derivative
+                            // differentiates wrt that atom, we also need to collect that index.
+                            // If libint ever removes that extra NCART dimension, remove the `+ natom`
+                            for (int i=0; i<natom; i++){
+                                if (i == desired_atom_idx) {
+                                    int offset_i = i + 2 + natom;
+                                    int tmp = 3 * offset_i + desired_coord;
+                                    potential_indices[j].push_back(tmp);
+                                }
                             }
                         }
-                    }
-                    // Now indices is a vector of vectors, where each subvector is your choices for the first derivative operator, second, third, etc
-                    // and the total number of subvectors is the order of differentiation
-                    // Now we want all combinations where we pick exactly one index from each subvector.
-                    // This is achievable through a cartesian product 
-                    std::vector<std::vector<int>> index_combos = cartesian_product(indices);
-                    std::vector<std::vector<int>> potential_index_combos = cartesian_product(potential_indices);
-                    std::vector<int> buffer_indices;
-                    std::vector<int> potential_buffer_indices;
-                    // Overlap/Kinetic integrals: collect needed buffer indices which we need to sum for this nuclear cartesian derivative
-                    for (auto vec : index_combos)  {
-                        std::sort(vec.begin(), vec.end());
-                        int buf_idx = 0;
-                        auto it = lower_bound(buffer_multidim_lookup.begin(), buffer_multidim_lookup.end(), vec);
-                        if (it != buffer_multidim_lookup.end()) buf_idx = it - buffer_multidim_lookup.begin();
-                        buffer_indices.push_back(buf_idx);
-                    }
-                    // Potential integrals: collect needed buffer indices which we need to sum for this nuclear cartesian derivative
-                    for (auto vec : potential_index_combos)  {
-                        std::sort(vec.begin(), vec.end());
-                        int buf_idx = 0;
-                        auto it = lower_bound(potential_buffer_multidim_lookup.begin(), potential_buffer_multidim_lookup.end(), vec);
-                        if (it != potential_buffer_multidim_lookup.end()) buf_idx = it - potential_buffer_multidim_lookup.begin();
-                        potential_buffer_indices.push_back(buf_idx);
-                    }
+                        // Now indices is a vector of vectors, where each subvector is your choices for the first derivative operator, second, third, etc
+                        // and the total number of subvectors is the order of differentiation
+                        // Now we want all combinations where we pick exactly one index from each subvector.
+                        // This is achievable through a cartesian product 
+                        std::vector<std::vector<int>> index_combos = cartesian_product(indices);
+                        std::vector<std::vector<int>> potential_index_combos = cartesian_product(potential_indices);
+                        std::vector<int> buffer_indices;
+                        std::vector<int> potential_buffer_indices;
+                        // Overlap/Kinetic integrals: collect needed buffer indices which we need to sum for this nuclear cartesian derivative
+                        for (auto vec : index_combos)  {
+                            std::sort(vec.begin(), vec.end());
+                            int buf_idx = 0;
+                            auto it = lower_bound(buffer_multidim_lookup.begin(), buffer_multidim_lookup.end(), vec);
+                            if (it != buffer_multidim_lookup.end()) buf_idx = it - buffer_multidim_lookup.begin();
+                            buffer_indices.push_back(buf_idx);
+                        }
+                        // Potential integrals: collect needed buffer indices which we need to sum for this nuclear cartesian derivative
+                        for (auto vec : potential_index_combos)  {
+                            std::sort(vec.begin(), vec.end());
+                            int buf_idx = 0;
+                            auto it = lower_bound(potential_buffer_multidim_lookup.begin(), potential_buffer_multidim_lookup.end(), vec);
+                            if (it != potential_buffer_multidim_lookup.end()) buf_idx = it - potential_buffer_multidim_lookup.begin();
+                            potential_buffer_indices.push_back(buf_idx);
+                        }
 
-                    // Loop over shell block for each buffer index which contributes to this derivative
-                    // Overlap and Kinetic
-                    for(auto i=0; i<buffer_indices.size(); ++i) {
-                        auto overlap_shellset = overlap_buffer[buffer_indices[i]];
-                        auto kinetic_shellset = kinetic_buffer[buffer_indices[i]];
-                        for(auto f1=0, idx=0; f1!=n1; ++f1) {
-                            for(auto f2=0; f2!=n2; ++f2, ++idx) {
-                                overlap_shellset_slab[f1][f2][nuc_idx] += overlap_shellset[idx];
-                                kinetic_shellset_slab[f1][f2][nuc_idx] += kinetic_shellset[idx];
+                        // Loop over shell block for each buffer index which contributes to this derivative
+                        // Overlap and Kinetic
+                        for(auto i=0; i<buffer_indices.size(); ++i) {
+                            auto overlap_shellset = overlap_buffer[buffer_indices[i]];
+                            auto kinetic_shellset = kinetic_buffer[buffer_indices[i]];
+                            for(auto f1=0, idx=0; f1!=n1; ++f1) {
+                                for(auto f2=0; f2!=n2; ++f2, ++idx) {
+                                    oei_block[block_offset(0, bf1 + f1, bf2 + f2, nuc_idx)] += overlap_shellset[idx];
+                                    oei_block[block_offset(1, bf1 + f1, bf2 + f2, nuc_idx)] += kinetic_shellset[idx];
+                                }
                             }
                         }
-                    }
-                    // Potential
-                    for(auto i=0; i<potential_buffer_indices.size(); ++i) {
-                        auto potential_shellset = potential_buffer[potential_buffer_indices[i]];
-                        for(auto f1=0, idx=0; f1!=n1; ++f1) {
-                            for(auto f2=0; f2!=n2; ++f2, ++idx) {
-                                potential_shellset_slab[f1][f2][nuc_idx] += potential_shellset[idx];
+                        // Potential
+                        for(auto i=0; i<potential_buffer_indices.size(); ++i) {
+                            auto potential_shellset = potential_buffer[potential_buffer_indices[i]];
+                            for(auto f1=0, idx=0; f1!=n1; ++f1) {
+                                for(auto f2=0; f2!=n2; ++f2, ++idx) {
+                                    oei_block[block_offset(2, bf1 + f1, bf2 + f2, nuc_idx)] += potential_shellset[idx];
+                                }
                             }
                         }
-                    }
-                } // Unique nuclear cartesian derivative indices loop
-
-                // Now write this shell set slab to HDF5 file
-                // Create file space hyperslab, defining where to write data to in file
-                hsize_t count[3] = {n1, n2, nderivs_triu};
-                hsize_t start[3] = {bf1, bf2, 0};
-                fspace.selectHyperslab(H5S_SELECT_SET, count, start, stride, block);
-                // Create dataspace defining for memory dataset to write to file
-                hsize_t mem_dims[] = {n1, n2, nderivs_triu};
-                DataSpace mspace(3, mem_dims);
-                mspace.selectHyperslab(H5S_SELECT_SET, count, zerostart, stride, block);
-                // Write buffer data 'shellset_slab' with data type double from memory dataspace `mspace` to file dataspace `fspace`
-                overlap_dataset->write(overlap_shellset_slab, PredType::NATIVE_DOUBLE, mspace, fspace);
-                kinetic_dataset->write(kinetic_shellset_slab, PredType::NATIVE_DOUBLE, mspace, fspace);
-                potential_dataset->write(potential_shellset_slab, PredType::NATIVE_DOUBLE, mspace, fspace);
-            }
-        } // shell duet loops
-    // Delete datasets for this derivative order
-    delete overlap_dataset;
-    delete kinetic_dataset;
-    delete potential_dataset;
+                    } // Unique nuclear cartesian derivative indices loop
+                }
+            } // shell duet loops
+
+            // Now write this block of derivative slices to HDF5 file
+            // Create file space hyperslab, defining where to write data to in file
+            hsize_t count[4] = {3, nbf, nbf, nblock};
+            hsize_t start[4] = {0, 0, 0, block_start};
+            fspace.selectHyperslab(H5S_SELECT_SET, count, start, stride, block);
+            // Create dataspace defining for memory dataset to write to file
+            hsize_t mem_dims[] = {3, nbf, nbf, nblock};
+            DataSpace mspace(4, mem_dims);
+            mspace.selectHyperslab(H5S_SELECT_SET, count, zerostart, stride, block);
+            // Write buffer data 'oei_block' with data type double from memory dataspace `mspace` to file dataspace `fspace`
+            oei_dataset->write(oei_block.data(), PredType::NATIVE_DOUBLE, mspace, fspace);
+        } // derivative index blocks loop
+    // Delete dataset for this derivative order
+    delete oei_dataset;
     } // deriv order loop
 // close the file
 delete file;
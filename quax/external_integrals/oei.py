@@ -1,11 +1,10 @@
 import jax
 import jax.numpy as jnp
 import numpy as np
-import h5py
-import os
 import psi4
 from . import libint_interface
-from ..utils import get_deriv_vec_idx, how_many_derivs
+from ..deriv_files import OEIDerivReader
+from ..utils import get_deriv_vec_idx_table
 
 jax.config.update("jax_enable_x64", True)
 
@@ -25,6 +24,7 @@ class OEI(object):
 
         self.mode = mode
         self.nbf = nbf
+        self.deriv_reader = OEIDerivReader(nbf, natoms, max_deriv_order)
 
         # Create new JAX primitives for overlap, kinetic, potential evaluation and their derivatives
         self.overlap_p = jax.core.Primitive("overlap")
@@ -105,25 +105,10 @@ class OEI(object):
             S = libint_interface.overlap_deriv(np.asarray(deriv_vec, int))
             return jnp.asarray(S).reshape(self.nbf, self.nbf)
         else:
-            idx = get_deriv_vec_idx(deriv_vec)
-            if os.path.exists("oei_derivs.h5"):
-                file_name = "oei_derivs.h5"
-                dataset_name = "overlap_deriv" + str(deriv_order)
-            elif os.path.exists("oei_partials.h5"):
-                file_name = "oei_partials.h5"
-                dataset_name = "overlap_deriv" + str(deriv_order) + "_" + str(idx)
-            else:
-                raise Exception("Something went wrong reading integral derivative file")
-            with h5py.File(file_name, "r") as f:
-                data_set = f[dataset_name]
-                if len(data_set.shape) == 3:
-                    S = data_set[:, :, idx]
-                elif len(data_set.shape) == 2:
-                    S = data_set[:, :]
-                else:
-                    raise Exception(
-                        "Something went wrong reading integral derivative file"
-                    )
+            idx = get_deriv_vec_idx_table(deriv_vec.shape[0], int(deriv_order))[
+                tuple(deriv_vec)
+            ]
+            S = self.deriv_reader.read_deriv_slices(deriv_order, [idx])[0, :, :, 0]
             return jnp.asarray(S)
 
     def kinetic_deriv_impl(self, geom, deriv_vec):
@@ -135,25 +120,10 @@ class OEI(object):
             T = libint_interface.kinetic_deriv(np.asarray(deriv_vec, int))
             return jnp.asarray(T).reshape(self.nbf, self.nbf)
         else:
-            idx = get_deriv_vec_idx(deriv_vec)
-            if os.path.exists("oei_derivs.h5"):
-                file_name = "oei_derivs.h5"
-                dataset_name = "kinetic_deriv" + str(deriv_order)
-            elif os.path.exists("oei_partials.h5"):
-                file_name = "oei_partials.h5"
-                dataset_name = "kinetic_deriv" + str(deriv_order) + "_" + str(idx)
-            else:
-                raise Exception("Something went wrong reading integral derivative file")
-            with h5py.File(file_name, "r") as f:
-                data_set = f[dataset_name]
-                if len(data_set.shape) == 3:
-                    T = data_set[:, :, idx]
-                elif len(data_set.shape) == 2:
-                    T = data_set[:, :]
-                else:
-                    raise Exception(
-                        "Something went wrong reading integral derivative file"
-                    )
+            idx = get_deriv_vec_idx_table(deriv_vec.shape[0], int(deriv_order))[
+                tuple(deriv_vec)
+            ]
+            T = self.deriv_reader.read_deriv_slices(deriv_order, [idx])[1, :, :, 0]
             return jnp.asarray(T)
 
     def potential_deriv_impl(self, geom, deriv_vec):
@@ -165,25 +135,10 @@ class OEI(object):
             V = libint_interface.potential_deriv(np.asarray(deriv_vec, int))
             return jnp.asarray(V).reshape(self.nbf, self.nbf)
         else:
-            idx = get_deriv_vec_idx(deriv_vec)
-            if os.path.exists("oei_derivs.h5"):
-                file_name = "oei_derivs.h5"
-                dataset_name = "potential_deriv" + str(deriv_order)
-            elif os.path.exists("oei_partials.h5"):
-                file_name = "oei_partials.h5"
-                dataset_name = "potential_deriv" + str(deriv_order) + "_" + str(idx)
-            else:
-                raise Exception("Something went wrong reading integral derivative file")
-            with h5py.File(file_name, "r") as f:
-                data_set = f[dataset_name]
-                if len(data_set.shape) == 3:
-                    V = data_set[:, :, idx]
-                elif len(data_set.shape) == 2:
-                    V = data_set[:, :]
-                else:
-                    raise Exception(
-                        "Something went wrong reading integral derivative file"
-                    )
+            idx = get_deriv_vec_idx_table(deriv_vec.shape[0], int(deriv_order))[
+                tuple(deriv_vec)
+            ]
+            V = self.deriv_reader.read_deriv_slices(deriv_order, [idx])[2, :, :, 0]
             return jnp.asarray(V)
 
     def overlap_jvp(self, primals, tangents):
@@ -222,39 +177,57 @@ class OEI(object):
         tangents_out = self.potential_deriv(geom, deriv_vec + tangents[0])
         return primals_out, tangents_out
 
+    def read_deriv_batch(self, integral, geom_batch, deriv_batch):
+        """
+        Read every slice requested by a batch of derivative vectors for one integral type
+        (0: overlap, 1: kinetic, 2: potential) at once, returning a (nbatch, nbf, nbf) array.
+        Returns None if the batch cannot be read this way, in which case
+        the slices are evaluated one at a time.
+        """
+        if self.mode == "core":
+            return None
+        # Under nested jacfwd the geometry is still being differentiated, and each slice must
+        # be bound to it through the primitive so the outer JVP picks up the next derivative order
+        if isinstance(geom_batch, jax.core.Tracer):
+            return None
+        block = self.deriv_reader.read_deriv_batch(integral, deriv_batch)
+        if block is None:
+            return None
+        return jnp.asarray(block)
+
     # Define Batching rules, this is only needed since jax.jacfwd will call vmap on the JVP's
     # of each oei function
     def overlap_deriv_batch(self, batched_args, batch_dims):
         # When the input argument of deriv_batch is batched along the 0'th axis
         # we want to evaluate every 2d slice, gather up a (ncart, n,n) array,
-        # (expand dims at 0 and concatenate at 0)
+        # (stack along axis 0)
         # and then return the results, indicating the out batch axis
         # is in the 0th position (return results, 0)
         geom_batch, deriv_batch = batched_args
         geom_dim, deriv_dim = batch_dims
-        results = []
-        for i in deriv_batch:
-            tmp = self.overlap_deriv(geom_batch, i)
-            results.append(jnp.expand_dims(tmp, axis=0))
-        results = jnp.concatenate(results, axis=0)
+        block = self.read_deriv_batch(0, geom_batch, deriv_batch)
+        if block is not None:
+            return block, 0
+        results = [self.overlap_deriv(geom_batch, i) for i in deriv_batch]
+        results = jnp.stack(results, axis=0)
         return results, 0
 
     def kinetic_deriv_batch(self, batched_args, batch_dims):
         geom_batch, deriv_batch = batched_args
         geom_dim, deriv_dim = batch_dims
-        results = []
-        for i in deriv_batch:
-            tmp = self.kinetic_deriv(geom_batch, i)
-            results.append(jnp.expand_dims(tmp, axis=0))
-        results = jnp.concatenate(results, axis=0)
+        block = self.read_deriv_batch(1, geom_batch, deriv_batch)
+        if block is not None:
+            return block, 0
+        results = [self.kinetic_deriv(geom_batch, i) for i in deriv_batch]
+        results = jnp.stack(results, axis=0)
         return results, 0
 
     def potential_deriv_batch(self, batched_args, batch_dims):
         geom_batch, deriv_batch = batched_args
         geom_dim, deriv_dim = batch_dims
-        results = []
-        for i in deriv_batch:
-            tmp = self.potential_deriv(geom_batch, i)
-            results.append(jnp.expand_dims(tmp, axis=0))
-        results = jnp.concatenate(results, axis=0)
+        block = self.read_deriv_batch(2, geom_batch, deriv_batch)
+        if block is not None:
+            return block, 0
+        results = [self.potential_deriv(geom_batch, i) for i in deriv_batch]
+        results = jnp.stack(results, axis=0)
         return results, 0
@@ -5,7 +5,7 @@ import h5py
 import os
 import psi4
 from . import libint_interface
-from ..utils import get_deriv_vec_idx, how_many_derivs
+from ..utils import get_deriv_vec_idx_table, how_many_derivs
 
 jax.config.update("jax_enable_x64", True)
 
@@ -62,14 +62,15 @@ class TEI(object):
     # Create primitive evaluation rules
     def tei_impl(self, geom):
         G = libint_interface.eri()
-        # d = int(np.sqrt(np.sqrt(G.shape[0])))
         G = G.reshape(self.nbf, self.nbf, self.nbf, self.nbf)
         return jnp.asarray(G)
 
     def tei_deriv_impl(self, geom, deriv_vec):
         deriv_vec = np.asarray(deriv_vec, int)
         deriv_order = np.sum(deriv_vec)
-        idx = get_deriv_vec_idx(deriv_vec)
+        idx = get_deriv_vec_idx_table(deriv_vec.shape[0], int(deriv_order))[
+            tuple(deriv_vec)
+        ]
 
         # Use eri derivatives in memory
         if self.mode == "core":
@@ -122,14 +123,11 @@ class TEI(object):
     def tei_deriv_batch(self, batched_args, batch_dims):
         # When the input argument of deriv_batch is batched along the 0'th axis
         # we want to evaluate every 4d slice, gather up a (ncart, n,n,n,n) array,
-        # (expand dims at 0 and concatenate at 0)
+        # (stack along axis 0)
         # and then return the results, indicating the out batch axis
         # is in the 0th position (return results, 0)
         geom_batch, deriv_batch = batched_args
         geom_dim, deriv_dim = batch_dims
-        results = []
-        for i in deriv_batch:
-            tmp = self.tei_deriv(geom_batch, i)
-            results.append(jnp.expand_dims(tmp, axis=0))
-        results = jnp.concatenate(results, axis=0)
+        results = [self.tei_deriv(geom_batch, i) for i in deriv_batch]
+        results = jnp.stack(results, axis=0)
         return results, 0
@@ -4,6 +4,7 @@ from jax.config import config
 config.update("jax_enable_x64", True)
 from jax.experimental import loops
 import jax.numpy as jnp
+from jax.scipy.linalg import solve_triangular
 from functools import partial
 
 
@@ -12,14 +13,10 @@ def nuclear_repulsion(geom, nuclear_charges):
     Compute the nuclear repulsion energy in a.u.
     """
     natom = nuclear_charges.shape[0]
-    nuc = 0
-    for i in range(natom):
-        for j in range(i):
-            nuc += (
-                nuclear_charges[i]
-                * nuclear_charges[j]
-                / jnp.linalg.norm(geom[i] - geom[j])
-            )
+    # Unique atom pairs only, so no zero distances enter the norm (and its derivatives)
+    i, j = jnp.triu_indices(natom, k=1)
+    r = jnp.linalg.norm(geom[i] - geom[j], axis=1)
+    nuc = jnp.sum(nuclear_charges[i] * nuclear_charges[j] / r)
     return nuc
 
 
@@ -32,9 +29,11 @@ def symmetric_orthogonalization(S):
     eigval, eigvec = jnp.linalg.eigh(S)
     cutoff = 1.0e-12
     above_cutoff = abs(eigval) > cutoff * jnp.max(abs(eigval))
-    val = 1 / jnp.sqrt(eigval[above_cutoff])
-    vec = eigvec[:, above_cutoff]
-    A = vec.dot(jnp.diag(val)).dot(vec.T)
+    # Zero out discarded eigenvalues instead of boolean indexing, which keeps shapes static under jit.
+    # The inner where keeps the sqrt (and its derivatives) finite for the discarded entries.
+    safe_eigval = jnp.where(above_cutoff, eigval, 1.0)
+    val = jnp.where(above_cutoff, 1 / jnp.sqrt(safe_eigval), 0.0)
+    A = (eigvec * val).dot(eigvec.T)
     return A
 
 
@@ -45,7 +44,8 @@ def cholesky_orthogonalization(S):
     by way of cholesky decomposition
     Scharfenberg, Peter; A New Algorithm for the Symmetric (Lowdin) Orthonormalization; Int J. Quant. Chem. 1977
     """
-    return jnp.linalg.inv(jnp.linalg.cholesky(S)).T
+    L = jnp.linalg.cholesky(S)
+    return solve_triangular(L, jnp.eye(S.shape[0]), lower=True).T
 
 
 def old_tei_transformation(G, C):
@@ -58,19 +58,16 @@ def old_tei_transformation(G, C):
 
 
 @jax.jit
-def transform(C, G):
-    return jnp.tensordot(C, G, axes=[(0,), (3,)])
-
-
 def tei_transformation(G, C):
     """
     New algo for TEI transform
     It's faster than psi4.MintsHelper.mo_transform() for basis sets <~120.
+    All four quarter-transformations are compiled together as a single XLA computation.
     """
-    G = transform(C, G)
-    G = transform(C, G)
-    G = transform(C, G)
-    G = transform(C, G)
+    G = jnp.tensordot(C, G, axes=[(0,), (3,)])
+    G = jnp.tensordot(C, G, axes=[(0,), (3,)])
+    G = jnp.tensordot(C, G, axes=[(0,), (3,)])
+    G = jnp.tensordot(C, G, axes=[(0,), (3,)])
     return G
 
 
@@ -2,12 +2,139 @@ import jax
 
 jax.config.update("jax_enable_x64", True)
 import jax.numpy as jnp
+from jax.scipy.linalg import solve_triangular
 from jax.experimental import host_callback
 import numpy as np
+import scipy.linalg
 import psi4
+from functools import partial
 
 from .ints import compute_integrals
-from .energy_utils import nuclear_repulsion, cholesky_orthogonalization
+from .energy_utils import nuclear_repulsion
+
+
+def jk_build(G, D):
+    """
+    Build the JK matrix 2 * J - K from the TEI's and density matrix.
+    J contracts D with the (2,3) axes of G, K contracts D with the (1,3) axes of G.
+    """
+    # Two N^4 contractions per iteration, rather than one contraction with a
+    # precombined 2 * G - G.transpose(0,2,1,3), which held a second N^4 tensor in memory
+    J = jnp.tensordot(G, D, axes=[(2, 3), (0, 1)])
+    K = jnp.tensordot(G, D, axes=[(1, 3), (0, 1)])
+    return 2 * J - K
+
+
+def host_eigh(Fp):
+    """
+    Diagonalize on the host with LAPACK's MRRR driver (dsyevr).
+    Not differentiable, only used when no derivatives are requested.
+    """
+    return scipy.linalg.eigh(Fp, driver="evr")
+
+
+@partial(jax.jit, static_argnums=(6, 7, 8, 11, 12))
+def rhf_scf(
+    H,
+    S,
+    L,
+    G,
+    shift,
+    D,
+    ndocc,
+    maxit,
+    damping,
+    damp_factor,
+    convergence,
+    debug=False,
+    use_host_eigh=False,
+):
+    """
+    Run the RHF SCF iterations, traced once into a single lax.while_loop.
+    L is the lower Cholesky factor of the overlap matrix, the orthogonalizer being A = L^(-T).
+    Returns the energy, MO coefficients, orbital energies and number of iterations performed.
+    With `debug`, the density and iteration count are sent to the host every iteration.
+    With `use_host_eigh`, the Fock matrix is diagonalized by SciPy on the host, which does not support AD.
+    """
+
+    def orthogonalize(M):
+        # A.T M A = L^(-1) M L^(-T), with triangular solves in place of an explicit inverse
+        X = solve_triangular(L, M, lower=True)
+        return solve_triangular(L, X.T, lower=True).T
+
+    def rhf_iter(F, JK, D):
+        E_scf = jnp.einsum("pq,pq->", F + H, D) #+ Enuc
+        # Only the density dependent part of the Fock matrix is transformed each iteration
+        Fp = Hp + orthogonalize(JK)
+        if use_host_eigh:
+            eps, C2 = host_callback.call(
+                host_eigh,
+                Fp,
+                result_shape=(
+                    jax.ShapeDtypeStruct(Fp.shape[:1], Fp.dtype),
+                    jax.ShapeDtypeStruct(Fp.shape, Fp.dtype),
+                ),
+            )
+        else:
+            eps, C2 = jnp.linalg.eigh(Fp)
+        C = solve_triangular(L, C2, trans=1, lower=True)
+        Cocc = C[:, :ndocc]
+        D = jnp.dot(Cocc, Cocc.T)
+        return E_scf, D, C, eps
+
+    def diis_rms(F, D):
+        diis_e = jnp.einsum("ij,jk,kl->il", F, D, S) - jnp.einsum(
+            "ij,jk,kl->il", S, D, F
+        )
+        # A.dot(diis_e).dot(A)
+        diis_e = solve_triangular(L, diis_e, trans=1, lower=True)
+        diis_e = solve_triangular(L, diis_e.T, lower=True).T
+        return jnp.mean(diis_e ** 2) ** 0.5
+
+    # Converge according to energy and DIIS residual to ensure eigenvalues and eigenvectors are maximally converged.
+    # This is crucial for numerical stability for higher order derivatives of correlated methods.
+    def cond_fn(state):
+        D, Dold, E_scf, E_old, dRMS, C, eps, iteration = state
+        not_converged = (jnp.abs(E_scf - E_old) > convergence) | (dRMS > convergence)
+        return not_converged & (iteration < maxit)
+
+    def body_fn(state):
+        D, Dold, E_scf, E_old, dRMS, C, eps, iteration = state
+        if debug:
+            D = host_callback.id_print(D, what="dm current")
+            iteration = host_callback.id_print(iteration, what="iter")
+        E_old = E_scf
+        if damping:
+            D = jnp.where(iteration < 10, damp_factor * (Dold + D), D)
+            Dold = jnp.where(iteration < 10, D, Dold)
+        # Build JK matrix: 2 * J - K
+        JK = jk_build(G, D)
+        # Build Fock
+        F = H + JK
+        # Update convergence error, held at 1.0 for the first two iterations
+        dRMS = jnp.where(iteration > 1, diis_rms(F, D), 1.0)
+        # Compute energy, transform Fock and diagonalize, get new density
+        E_scf, D, C, eps = rhf_iter(F, JK, D)
+        return D, Dold, E_scf, E_old, dRMS, C, eps, iteration + 1
+
+    # Transformed core Hamiltonian, constant across iterations
+    Hp = orthogonalize(H) + shift
+
+    nbf = H.shape[0]
+    state = (
+        D,
+        D,
+        jnp.asarray(1.0),
+        jnp.asarray(0.0),
+        jnp.asarray(1.0),
+        jnp.zeros_like(H),
+        jnp.zeros(nbf, dtype=H.dtype),
+        jnp.asarray(0),
+    )
+    D, Dold, E_scf, E_old, dRMS, C, eps, iteration = jax.lax.while_loop(
+        cond_fn, body_fn, state
+    )
+    return E_scf, C, eps, iteration
 
 
 def restricted_hartree_fock(
@@ -26,38 +153,22 @@ def restricted_hartree_fock(
     damping = options["damping"]
     damp_factor = options["damp_factor"]
     spectral_shift = options["spectral_shift"]
+    debug = options.get("debug", False)
     convergence = 1e-10
 
     nelectrons = int(jnp.sum(nuclear_charges)) - charge
     ndocc = nelectrons // 2
 
-    # If we are doing MP2 or CCSD after, might as well use jit-compiled JK-build, since HF will not be memory bottleneck
-    if return_aux_data:
-        jk_build = jax.jit(
-            jax.vmap(
-                jax.vmap(
-                    lambda x, y: jnp.tensordot(x, y, axes=[(0, 1), (0, 1)]),
-                    in_axes=(0, None),
-                ),
-                in_axes=(0, None),
-            )
-        )
-    else:
-        jk_build = jax.vmap(
-            jax.vmap(
-                lambda x, y: jnp.tensordot(x, y, axes=[(0, 1), (0, 1)]),
-                in_axes=(0, None),
-            ),
-            in_axes=(0, None),
-        )
-
-    host_callback.id_print(maxit, what="do integrals")
+    if debug:
+        host_callback.id_print(maxit, what="do integrals")
     S, T, V, G = compute_integrals(
         geom, basis_name, xyz_path, nuclear_charges, charge, deriv_order, options
     )
-    # Canonical orthogonalization via cholesky decomposition
-    host_callback.id_print(maxit, what="cholesky")
-    A = cholesky_orthogonalization(S)
+    # Canonical orthogonalization via cholesky decomposition.
+    # Only the Cholesky factor is kept, the SCF applies its inverse with triangular solves
+    if debug:
+        host_callback.id_print(maxit, what="cholesky")
+    L = jnp.linalg.cholesky(S)
 
     nbf = S.shape[0]
 
@@ -71,7 +182,8 @@ def restricted_hartree_fock(
     else:
         shift = jnp.zeros_like(S)
 
-    host_callback.id_print(maxit, what="hamiltonian")
+    if debug:
+        host_callback.id_print(maxit, what="hamiltonian")
     H = T + V
     Enuc = nuclear_repulsion(geom.reshape(-1, 3), nuclear_charges)
     #host_callback.id_print(dmguess, what="dmguess")
@@ -81,50 +193,25 @@ def restricted_hartree_fock(
         D = jnp.array(dmguess)
     
 
-    def rhf_iter(F, D):
-        E_scf = jnp.einsum("pq,pq->", F + H, D) #+ Enuc
-        Fp = jnp.dot(A.T, jnp.dot(F, A))
-        Fp = Fp + shift
-        eps, C2 = jnp.linalg.eigh(Fp)
-        C = jnp.dot(A, C2)
-        Cocc = C[:, :ndocc]
-        D = jnp.dot(Cocc, Cocc.T)
-        return E_scf, D, C, eps
-
-    iteration = 0
-    E_scf = 1.0
-    E_old = 0.0
-    Dold = D
-    dRMS = 1.0
-
-    # Converge according to energy and DIIS residual to ensure eigenvalues and eigenvectors are maximally converged.
-    # This is crucial for numerical stability for higher order derivatives of correlated methods.
-    while (abs(E_scf - E_old) > convergence) or (dRMS > convergence):
-        host_callback.id_print(D, what="dm current")
-        E_old = E_scf * 1
-        if damping:
-            if iteration < 10:
-                D = Dold * damp_factor + D * damp_factor
-                Dold = D * 1
-        # Build JK matrix: 2 * J - K
-        JK = 2 * jk_build(G, D)
-        JK -= jk_build(G.transpose((0, 2, 1, 3)), D)
-        # Build Fock
-        F = H + JK
-        # Update convergence error
-        if iteration > 1:
-            diis_e = jnp.einsum("ij,jk,kl->il", F, D, S) - jnp.einsum(
-                "ij,jk,kl->il", S, D, F
-            )
-            diis_e = A.dot(diis_e).dot(A)
-            dRMS = jnp.mean(diis_e ** 2) ** 0.5
-        # Compute energy, transform Fock and diagonalize, get new density
-        host_callback.id_print(iteration, what="iter")
-        E_scf, D, C, eps = rhf_iter(F, D)
-        iteration += 1
-        if iteration == maxit:
-            break
-    print(iteration, " RHF iterations performed")
+    # Energies alone do not need a differentiable eigendecomposition,
+    # unless the caller is differentiating this function directly
+    use_host_eigh = deriv_order == 0 and not isinstance(geom, jax.core.Tracer)
+    E_scf, C, eps, iteration = rhf_scf(
+        H,
+        S,
+        L,
+        G,
+        shift,
+        D,
+        ndocc,
+        maxit,
+        damping,
+        damp_factor,
+        convergence,
+        debug,
+        use_host_eigh,
+    )
+    print(int(iteration), " RHF iterations performed")
 
     # If many orbitals are degenerate, warn that higher order derivatives may be unstable
     tmp = jnp.round(eps, 6)
@@ -14,6 +14,7 @@ from ..integrals.tei import tei_array
 from ..integrals.oei import oei_arrays
 
 from ..utils import get_deriv_vec_idx, get_required_deriv_vecs
+from ..deriv_files import close_h5_cache
 
 # Check for Libint interface
 from ..constants import libint_imported
@@ -33,7 +34,8 @@ def compute_integrals(
 
     if libint_imported and libint_interface.LIBINT2_MAX_DERIV_ORDER >= deriv_order:
         if algo == "libint_core":
-            host_callback.id_print(charge, what="libint_core")
+            if options.get("debug"):
+                host_callback.id_print(charge, what="libint_core")
             libint_interface.initialize(xyz_path, basis_name)
             # Precompute TEI derivatives
             tei_obj = TEI(basis_name, xyz_path, deriv_order, "core")
@@ -57,7 +59,8 @@ def compute_integrals(
             return S, T, V, G
 
         elif algo == "libint_disk" and deriv_order > 0:
-            host_callback.id_print(charge, what="libint_disk")
+            if options.get("debug"):
+                host_callback.id_print(charge, what="libint_disk")
             # Check disk for currently existing integral derivatives
             check = check_disk(geom, basis_name, xyz_path, deriv_order)
 
@@ -74,6 +77,8 @@ def compute_integrals(
             else:
                 # Else write integral derivs to disk
                 if deriv_order <= 2:
+                    # Release any cached read handles before the file is truncated
+                    close_h5_cache()
                     libint_interface.initialize(xyz_path, basis_name)
                     libint_interface.oei_deriv_disk(deriv_order)
                     libint_interface.eri_deriv_disk(deriv_order)
@@ -112,7 +117,8 @@ def compute_integrals(
         # elif algo == 'quax_disk':
 
         elif algo == "quax_core":
-            host_callback.id_print(charge, what="qcore")
+            if options.get("debug"):
+                host_callback.id_print(charge, what="qcore")
             with open(xyz_path, "r") as f:
                 tmp = f.read()
             molecule = psi4.core.Molecule.from_string(tmp, "xyz+")
@@ -122,7 +128,8 @@ def compute_integrals(
 
     # If Libint not imported or Libint version doesnt support requested deriv order, use Quax integrals
     else:
-        host_callback.id_print(charge, what="qcore")
+        if options.get("debug"):
+            host_callback.id_print(charge, what="qcore")
         with open(xyz_path, "r") as f:
             tmp = f.read()
         molecule = psi4.core.Molecule.from_string(tmp, "xyz+")
@@ -150,9 +157,12 @@ def check_disk(geom, basis_name, xyz_path, deriv_order, address=None):
         nbf = basis_set.nbf()
         # Check if there are `deriv_order` datasets in the eri file
         correct_deriv_order = len(erifile) == deriv_order
-        # Check nbf dimension of integral arrays
-        sample_dataset_name = list(oeifile.keys())[0]
-        correct_nbf = oeifile[sample_dataset_name].shape[0] == nbf
+        # Check OEI's are in the packed (3, nbf, nbf, nderivs) layout, and their nbf dimension.
+        # Files written in the older per-integral-type layout are rewritten.
+        correct_nbf = False
+        if "oei_deriv1" in oeifile:
+            shape = oeifile["oei_deriv1"].shape
+            correct_nbf = len(shape) == 4 and shape[0] == 3 and shape[1] == nbf
         oeifile.close()
         erifile.close()
         correct_int_derivs = correct_deriv_order and correct_nbf
@@ -172,8 +182,21 @@ def check_disk(geom, basis_name, xyz_path, deriv_order, address=None):
         molecule = psi4.core.Molecule.from_string(tmp, "xyz+")
         basis_set = psi4.core.BasisSet.build(molecule, "BASIS", basis_name, puream=0)
         nbf = basis_set.nbf()
-        sample_dataset_name = list(oeifile.keys())[0]
-        correct_nbf = oeifile[sample_dataset_name].shape[0] == nbf
+        # Check OEI partials are in the packed (3, nbf, nbf) layout, and their nbf dimension
+        dataset_names = list(oeifile.keys())
+        correct_nbf = len(dataset_names) > 0
+        for name in dataset_names:
+            shape = oeifile[name].shape
+            if not (
+                name.startswith("oei_deriv")
+                and len(shape) == 3
+                and shape[0] == 3
+                and shape[1] == nbf
+            ):
+                correct_nbf = False
+                break
+        oeifile.close()
+        erifile.close()
         correct_int_derivs = correct_nbf
     return correct_int_derivs
 
@@ -254,10 +277,12 @@ def write_integrals(molecule, basis_name, deriv_order, address):
                 jacfwd(jacfwd(jacfwd(jacfwd(jacfwd(tei_wrapper, i), j), k), l), m), n
             )(*geom_list, **kwargs)
         # Save partial derivative arrays to disk
+        close_h5_cache()
         f = h5py.File("oei_partials.h5", "a")
-        f.create_dataset("overlap_deriv" + str(order) + "_" + str(flat_idx), data=dS)
-        f.create_dataset("kinetic_deriv" + str(order) + "_" + str(flat_idx), data=dT)
-        f.create_dataset("potential_deriv" + str(order) + "_" + str(flat_idx), data=dV)
+        # Overlap, kinetic and potential are packed along the first axis
+        f.create_dataset(
+            "oei_deriv" + str(order) + "_" + str(flat_idx), data=np.stack([dS, dT, dV])
+        )
         f.close()
 
         f = h5py.File("eri_partials.h5", "a")
@@ -1,5 +1,6 @@
 import numpy as np
 import itertools
+import functools
 
 
 def how_many_derivs(k, n):
@@ -37,6 +38,24 @@ def get_deriv_vec_idx(deriv_vec):
     return idx
 
 
+@functools.lru_cache(maxsize=None)
+def get_deriv_vec_idx_table(ncart, deriv_order):
+    """
+    Precompute the lookup done by get_deriv_vec_idx for every derivative vector
+    of shape NCART at order `deriv_order`. Built lazily, once per (ncart, deriv_order),
+    and shared between all callers.
+    Returns a dict mapping tuple(deriv_vec) to the flattened generalized upper triangle index.
+    """
+    table = {}
+    combos = itertools.combinations_with_replacement(range(ncart), deriv_order)
+    for idx, c in enumerate(combos):
+        deriv_vec = [0] * ncart
+        for i in c:
+            deriv_vec[i] += 1
+        table[tuple(deriv_vec)] = idx
+    return table
+
+
 # Sum over all partitions of the set range(deriv_order)
 def partition(collection):
     if len(collection) == 1:
@@ -14,7 +14,7 @@ if __name__ == "__main__":
             'numpy>=1.7',
             'jax>=0.2.9',
             'jaxlib>=0.1.61',
-            'h5py>=2.8.0'
+            'h5py>=2.9.0'
         ],
         extras_require={
             'tests': [
@@ -0,0 +1,80 @@
+"""
+Test reading integral derivative slices from disk
+"""
+import pytest
+import numpy as np
+import h5py
+
+from quax.utils import how_many_derivs, get_deriv_vec_idx
+from quax.deriv_files import OEIDerivReader, close_h5_cache
+
+natoms = 2
+nbf = 3
+max_deriv_order = 2
+
+@pytest.fixture
+def oei_derivs(tmp_path, monkeypatch):
+    """Write a small oei_derivs.h5 in the packed (3, nbf, nbf, nderivs) layout"""
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(0)
+    data = {}
+    with h5py.File("oei_derivs.h5", "w") as f:
+        for deriv_order in range(1, max_deriv_order + 1):
+            nderivs = how_many_derivs(natoms, deriv_order)
+            data[deriv_order] = rng.random((3, nbf, nbf, nderivs))
+            f.create_dataset("oei_deriv" + str(deriv_order), data=data[deriv_order], chunks=(3, nbf, nbf, 1))
+    yield data
+    close_h5_cache()
+
+@pytest.fixture
+def oei_partials(tmp_path, monkeypatch):
+    """Write a small oei_partials.h5 with one (3, nbf, nbf) dataset per derivative index"""
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(1)
+    nderivs = how_many_derivs(natoms, 1)
+    data = {1: rng.random((3, nbf, nbf, nderivs))}
+    with h5py.File("oei_partials.h5", "w") as f:
+        for idx in range(nderivs):
+            f.create_dataset("oei_deriv1_" + str(idx), data=data[1][..., idx])
+    yield data
+    close_h5_cache()
+
+@pytest.mark.parametrize("deriv_order,idxs", [(1, [0]), (1, [4, 1, 4, 0]), (2, [20, 3, 3, 7])])
+def test_read_deriv_slices(oei_derivs, deriv_order, idxs):
+    reader = OEIDerivReader(nbf, natoms, max_deriv_order)
+    expected = oei_derivs[deriv_order][..., idxs]
+    assert np.allclose(reader.read_deriv_slices(deriv_order, idxs), expected)
+    # Second read is served from the cached slices
+    assert np.allclose(reader.read_deriv_slices(deriv_order, idxs), expected)
+    assert len(reader.deriv_slices) == len(set(idxs))
+
+def test_read_deriv_slices_eviction(oei_derivs):
+    reader = OEIDerivReader(nbf, natoms, max_deriv_order)
+    reader.max_deriv_slices = 2
+    assert np.allclose(reader.read_deriv_slices(1, [0, 1, 2]), oei_derivs[1][..., [0, 1, 2]])
+    assert list(reader.deriv_slices) == [(1, 1), (1, 2)]
+    assert np.allclose(reader.read_deriv_slices(2, [5]), oei_derivs[2][..., [5]])
+    assert list(reader.deriv_slices) == [(1, 2), (2, 5)]
+
+def test_read_deriv_slices_partials(oei_partials):
+    reader = OEIDerivReader(nbf, natoms, 1)
+    idxs = [5, 2, 2]
+    assert np.allclose(reader.read_deriv_slices(1, idxs), oei_partials[1][..., idxs])
+
+@pytest.mark.parametrize("integral", [0, 1, 2])
+def test_read_deriv_batch(oei_derivs, integral):
+    reader = OEIDerivReader(nbf, natoms, max_deriv_order)
+    deriv_batch = np.zeros((3 * natoms, 3 * natoms), int)
+    deriv_batch[:, 1] += 1
+    deriv_batch += np.eye(3 * natoms, dtype=int)
+    block = reader.read_deriv_batch(integral, deriv_batch)
+    assert block.shape == (3 * natoms, nbf, nbf)
+    for i, deriv_vec in enumerate(deriv_batch):
+        idx = get_deriv_vec_idx(deriv_vec)
+        assert np.allclose(block[i], oei_derivs[2][integral, :, :, idx])
+
+def test_read_deriv_batch_unsupported(oei_derivs):
+    reader = OEIDerivReader(nbf, natoms, max_deriv_order)
+    assert reader.read_deriv_batch(0, np.zeros((2, 3 * natoms), int)) is None
+    mixed = np.array([[1, 0, 0, 0, 0, 0], [1, 1, 0, 0, 0, 0]])
+    assert reader.read_deriv_batch(0, mixed) is None
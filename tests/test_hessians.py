@@ -24,6 +24,7 @@ psi4.set_options({'basis': basis_name,
                   'fd_project':False})
 
 options = {'damping':True, 'spectral_shift':False, 'integral_algo': 'quax_core'}
+disk_options = {'damping':True, 'spectral_shift':False, 'integral_algo': 'libint_disk'}
 
 def test_hartree_fock_hessian(method='hf'):
     psi_deriv = np.round(np.asarray(psi4.hessian(method + '/' + basis_name)), 10)
@@ -49,3 +50,12 @@ def test_ccsd_t_hessian(method='ccsd(t)'):
     assert np.allclose(psi_deriv, quax_deriv)
     assert np.allclose(psi_deriv[0,0], quax_partial00)
 
+@pytest.mark.skipif(not quax.constants.libint_imported, reason="Libint interface not built")
+def test_hartree_fock_hessian_libint_disk(tmp_path, monkeypatch, method='hf'):
+    # Integral derivative files are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    psi_deriv = np.round(np.asarray(psi4.hessian(method + '/' + basis_name)), 10)
+    n = psi_deriv.shape[0]
+    quax_deriv = np.asarray(quax.core.derivative(molecule, basis_name, method, deriv_order=2, options=disk_options)).reshape(n,n)
+    quax.deriv_files.close_h5_cache()
+    assert np.allclose(psi_deriv, quax_deriv)
@@ -0,0 +1,14 @@
+"""
+Test derivative bookkeeping utilities
+"""
+import pytest
+import numpy as np
+
+from quax.utils import how_many_derivs, get_deriv_vec_idx, get_deriv_vec_idx_table
+
+@pytest.mark.parametrize("natoms,deriv_order", [(1, 1), (2, 1), (2, 2), (3, 2), (2, 3), (2, 4)])
+def test_deriv_vec_idx_table(natoms, deriv_order):
+    table = get_deriv_vec_idx_table(3 * natoms, deriv_order)
+    assert len(table) == how_many_derivs(natoms, deriv_order)
+    for deriv_vec, idx in table.items():
+        assert get_deriv_vec_idx(np.asarray(deriv_vec, int)) == idx